@@ -0,0 +1,60 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional Cython fast path for ktDNS.
+
+Compiles the per-query critical path (QNAME parse, template cache
+lookup, transaction ID/flags splice) to C, removing bytecode dispatch
+from the hot loop. Build in place with:
+
+    python3 setup.py build_ext --inplace
+
+ktDNS falls back to the pure-Python path when this module is absent.
+"""
+
+
+cpdef bytes build_response(const unsigned char[::1] data, dict cache, tuple flag_table):
+    """
+    Answer a query from the response template cache.
+    :param data: the raw datagram received from the client
+    :param cache: the template cache keyed on (tuple(domain), QTYPE)
+    :param flag_table: the precomputed 256-entry response flags table
+    :return: the response, or None on a cache miss (the caller then
+             builds the response in Python and stores the template)
+    """
+    cdef Py_ssize_t size = data.shape[0]
+    cdef Py_ssize_t i = 12
+    cdef int length
+    cdef list domain = []
+
+    # The datagram is attacker-controlled and bounds checking is off,
+    # so every read below is guarded against the buffer end by hand;
+    # malformed input bails out to the (checked) Python path.
+    while True:
+        if i >= size:
+            return None
+        length = data[i]
+        if length == 0:
+            i += 1
+            break
+        if i + 1 + length > size:
+            return None
+        domain.append(bytes(data[i + 1:i + 1 + length]).decode('ascii'))
+        i += 1 + length
+    # the root label, kept so the key matches the Python-side parser
+    domain.append('')
+
+    if i + 2 > size:
+        return None
+    cdef int QTYPE = (data[i] << 8) | data[i + 1]
+
+    template = cache.get((tuple(domain), QTYPE))
+    if template is None:
+        return None
+
+    cdef bytearray out = bytearray(<bytes>template)
+    cdef bytes flags = flag_table[data[2]]
+    out[0] = data[0]
+    out[1] = data[1]
+    out[2] = flags[0]
+    out[3] = flags[1]
+    return bytes(out)
@@ -0,0 +1,15 @@
+"""
+Build the optional Cython fast path:
+
+    python3 setup.py build_ext --inplace
+
+ktDNS runs fine without it.
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name='ktdns-fast',
+    ext_modules=cythonize('ktdns_fast.pyx'),
+)